@@ -39,27 +39,46 @@ def clean():
         spec.unlink()
 
 
-def build():
-    """执行打包"""
+def build(noupx: bool = False, mode: str = "onefile", noarchive: bool = False):
+    """执行打包
+
+    onefile 模式每次启动都要把 PYZ 解压到临时目录，冷启动慢；
+    onedir 模式跳过自解压阶段，适合长期运行的服务。
+    """
     output_name = get_output_name()
+    app_name = output_name.replace(".exe", "")
 
     print(f"[Build] 目标平台: {platform.system()} {platform.machine()}")
+    print(f"[Build] 打包模式: {mode}")
     print(f"[Build] 输出文件: {output_name}")
 
     # PyInstaller 参数
     cmd = [
         sys.executable, "-m", "PyInstaller",
-        "--onefile",                    # 单文件
-        "--name", output_name.replace(".exe", ""),
+        f"--{mode}",                    # onefile: 单文件 / onedir: 免解压目录
+        "--name", app_name,
         "--clean",                      # 清理临时文件
         "--noconfirm",                  # 不确认覆盖
-        # 收集完整包 (包含 metadata)
-        "--collect-all", "fastmcp",
-        "--collect-all", "mcp",
-        "--collect-all", "rich",
-        "--collect-all", "lupa",
-        "--collect-all", "fakeredis",
-        "--collect-all", "docket",
+        "--optimize", "2",              # -OO 级字节码，去掉依赖包里的 docstring/assert
+        # 收集子模块 (--collect-all 会连数据文件一起全量打包，体积膨胀严重)
+        "--collect-submodules", "fastmcp",
+        "--collect-submodules", "mcp",
+        "--collect-submodules", "rich",
+        "--collect-submodules", "lupa",
+        "--collect-submodules", "fakeredis",
+        "--collect-submodules", "docket",
+        # fastmcp/mcp 运行时要读自己的 metadata
+        "--copy-metadata", "fastmcp",
+        "--copy-metadata", "mcp",
+        # 排除本项目用不到的重量级包
+        "--exclude-module", "numpy",
+        "--exclude-module", "pandas",
+        "--exclude-module", "matplotlib",
+        "--exclude-module", "tkinter",
+        "--exclude-module", "PIL",
+        "--exclude-module", "IPython",
+        "--exclude-module", "setuptools",
+        "--exclude-module", "pytest",
         # Hidden imports
         "--hidden-import", "uvicorn",
         "--hidden-import", "uvicorn.logging",
@@ -82,19 +101,54 @@ def build():
         str(PROJECT_ROOT / "main.py")
     ]
 
+    # .pyc 直接留在磁盘上，省掉每次 import 的 PYZ 解压
+    if noarchive:
+        cmd.insert(-1, "--noarchive")
+
+    # Linux/Mac: 去掉共享库的符号表
+    if platform.system() != "Windows":
+        cmd.insert(-1, "--strip")
+
+    # 检测到 UPX 时启用压缩 (--noupx 可关闭，便于排查问题)
+    upx_path = None if noupx else shutil.which("upx")
+    if upx_path:
+        print(f"[Build] 启用 UPX 压缩: {upx_path}")
+        cmd[-1:-1] = [
+            "--upx-dir", str(Path(upx_path).parent),
+            # UPX 会损坏部分 Windows 运行时 DLL
+            "--upx-exclude", "vcruntime140.dll",
+            "--upx-exclude", "python3*.dll",
+        ]
+    else:
+        cmd.insert(-1, "--noupx")
+
     print(f"[Build] 执行命令: {' '.join(cmd)}")
 
     result = subprocess.run(cmd, cwd=PROJECT_ROOT)
 
     if result.returncode == 0:
-        output_path = DIST_DIR / output_name
-        if output_path.exists():
-            size_mb = output_path.stat().st_size / (1024 * 1024)
-            print(f"\n[Build] ✅ 打包成功!")
-            print(f"[Build] 输出文件: {output_path}")
-            print(f"[Build] 文件大小: {size_mb:.2f} MB")
+        if mode == "onedir":
+            output_path = DIST_DIR / app_name
+            if output_path.exists():
+                # onedir 目录打成压缩包便于分发
+                archive = shutil.make_archive(
+                    str(DIST_DIR / app_name), "gztar",
+                    root_dir=DIST_DIR, base_dir=app_name
+                )
+                size_mb = Path(archive).stat().st_size / (1024 * 1024)
+                print(f"\n[Build] ✅ 打包成功!")
+                print(f"[Build] 输出目录: {output_path}")
+                print(f"[Build] 分发压缩包: {archive} ({size_mb:.2f} MB)")
+                return
         else:
-            print(f"\n[Build] ⚠️  打包完成但未找到输出文件")
+            output_path = DIST_DIR / output_name
+            if output_path.exists():
+                size_mb = output_path.stat().st_size / (1024 * 1024)
+                print(f"\n[Build] ✅ 打包成功!")
+                print(f"[Build] 输出文件: {output_path}")
+                print(f"[Build] 文件大小: {size_mb:.2f} MB")
+                return
+        print(f"\n[Build] ⚠️  打包完成但未找到输出文件")
     else:
         print(f"\n[Build] ❌ 打包失败!")
         sys.exit(1)
@@ -136,6 +190,11 @@ def main():
     parser = argparse.ArgumentParser(description="TerminalMCP 打包脚本")
     parser.add_argument("--all", action="store_true", help="显示跨平台打包说明")
     parser.add_argument("--clean", action="store_true", help="仅清理构建文件")
+    parser.add_argument("--noupx", action="store_true", help="禁用 UPX 压缩")
+    parser.add_argument("--mode", choices=["onefile", "onedir"], default="onefile",
+                        help="打包模式: onefile 单文件 / onedir 免解压目录 (默认: onefile)")
+    parser.add_argument("--noarchive", action="store_true",
+                        help=".pyc 留在磁盘而不打进 PYZ，加快启动")
     args = parser.parse_args()
 
     if args.all:
@@ -148,7 +207,7 @@ def main():
         return
 
     clean()
-    build()
+    build(noupx=args.noupx, mode=args.mode, noarchive=args.noarchive)
 
 
 if __name__ == "__main__":
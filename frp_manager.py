@@ -1,17 +1,30 @@
+import hashlib
+import http.client
 import os
 import platform
 import shutil
 import subprocess
 import tarfile
 import tempfile
+import threading
+import time
+import urllib.error
 import urllib.request
 import zipfile
+from collections import deque
 from pathlib import Path
 from typing import Optional
 
 # FRP 版本，与你服务端保持一致
 FRP_VERSION = "0.65.0"
 
+# 下载失败重试次数
+DOWNLOAD_RETRIES = 3
+
+# 超过该大小且服务端支持 Range 时启用并行分段下载
+PARALLEL_DOWNLOAD_THRESHOLD = 4 * 1024 * 1024
+PARALLEL_DOWNLOAD_WORKERS = 4
+
 # 下载地址映射
 FRP_DOWNLOAD_URLS = {
     ("Linux", "x86_64"): f"https://github.com/fatedier/frp/releases/download/v{FRP_VERSION}/frp_{FRP_VERSION}_linux_amd64.tar.gz",
@@ -22,6 +35,28 @@ FRP_DOWNLOAD_URLS = {
 }
 
 
+def _copy_fast(src, dst):
+    """拷贝文件内容: 两端都是真实文件时用 sendfile 零拷贝，否则用 1MB 大缓冲
+
+    解压流中的成员对象没有真实 fd，自动走缓冲路径。
+    """
+    if hasattr(os, "sendfile"):
+        try:
+            src_fd = src.fileno()
+            dst_fd = dst.fileno()
+            size = os.fstat(src_fd).st_size
+            offset = 0
+            while offset < size:
+                sent = os.sendfile(dst_fd, src_fd, offset, size - offset)
+                if sent == 0:
+                    break
+                offset += sent
+            return
+        except (OSError, AttributeError):
+            pass
+    shutil.copyfileobj(src, dst, length=1024 * 1024)
+
+
 class FRPManager:
     def __init__(self, server_addr: str, token: str, remote_port: int,
                  local_port: int = 8001, tunnel_name: str = "terminal-mcp"):
@@ -39,6 +74,10 @@ class FRPManager:
         self.config_path: Optional[Path] = None
         self.process: Optional[subprocess.Popen] = None
 
+        # frpc 输出的有界环形缓冲，后台线程持续排空管道
+        self._stdout_ring: deque = deque(maxlen=4096)
+        self._stderr_ring: deque = deque(maxlen=4096)
+
     def _get_platform_info(self) -> tuple:
         """获取当前平台信息"""
         system = platform.system()
@@ -59,69 +98,192 @@ class FRPManager:
             return "frpc.exe"
         return "frpc"
 
+    def _cache_dir(self) -> Path:
+        """frpc 缓存目录，按版本+平台区分，重启后仍然有效
+
+        用户缓存目录不可写时退回临时目录。
+        """
+        system, machine = self._get_platform_info()
+        if system == "Windows":
+            base = Path(os.environ.get("LOCALAPPDATA") or Path.home() / "AppData" / "Local")
+        elif system == "Darwin":
+            base = Path.home() / "Library" / "Caches"
+        else:
+            base = Path(os.environ.get("XDG_CACHE_HOME") or Path.home() / ".cache")
+
+        cache_dir = base / "terminal-mcp" / "frp" / FRP_VERSION / f"{system}-{machine}"
+        try:
+            cache_dir.mkdir(parents=True, exist_ok=True)
+            return cache_dir
+        except OSError:
+            return self.work_dir
+
+    @staticmethod
+    def _sha256_of(path: Path) -> str:
+        """计算文件的 SHA-256"""
+        h = hashlib.sha256()
+        with open(path, "rb") as f:
+            while chunk := f.read(256 * 1024):
+                h.update(chunk)
+        return h.hexdigest()
+
+    def _cached_frpc_valid(self, frpc_path: Path, digest_path: Path) -> bool:
+        """校验缓存的 frpc 是否完整，损坏时删除"""
+        if not frpc_path.exists():
+            return False
+        if digest_path.exists() and digest_path.read_text().strip() == self._sha256_of(frpc_path):
+            return True
+        print(f"[FRP] 缓存的 frpc 校验失败，重新下载: {frpc_path}")
+        frpc_path.unlink(missing_ok=True)
+        digest_path.unlink(missing_ok=True)
+        return False
+
     def download_frpc(self) -> Path:
         """下载并解压 frpc"""
         frpc_name = self._get_frpc_name()
-        frpc_path = self.work_dir / frpc_name
+        cache_dir = self._cache_dir()
+        frpc_path = cache_dir / frpc_name
+        digest_path = cache_dir / f"{frpc_name}.sha256"
 
-        # 如果已存在且可执行，直接返回
-        if frpc_path.exists():
-            print(f"[FRP] 使用已存在的 frpc: {frpc_path}")
+        # 缓存命中且校验通过，直接返回
+        if self._cached_frpc_valid(frpc_path, digest_path):
+            print(f"[FRP] 使用已缓存的 frpc: {frpc_path}")
             self.frpc_path = frpc_path
             return frpc_path
 
         url = self._get_download_url()
         print(f"[FRP] 下载 frpc 从: {url}")
 
-        # 下载文件
-        archive_name = url.split("/")[-1]
-        archive_path = self.work_dir / archive_name
+        # 边下载边解压，只写出 frpc 这一个文件，不落盘压缩包
+        if url.endswith(".tar.gz"):
+            self._extract_frpc_from_tar_stream(url, frpc_name, frpc_path)
+        else:
+            self._extract_frpc_from_zip(url, frpc_name, frpc_path)
 
-        try:
-            urllib.request.urlretrieve(url, archive_path)
-            print(f"[FRP] 下载完成: {archive_path}")
-        except Exception as e:
-            raise RuntimeError(f"下载失败: {e}")
-
-        # 解压
-        extract_dir = self.work_dir / "frp_extract"
-        if extract_dir.exists():
-            shutil.rmtree(extract_dir)
-        extract_dir.mkdir()
+        if not frpc_path.exists():
+            raise RuntimeError("解压后未找到 frpc")
 
-        try:
-            if archive_name.endswith(".tar.gz"):
-                with tarfile.open(archive_path, "r:gz") as tar:
-                    tar.extractall(extract_dir)
-            elif archive_name.endswith(".zip"):
-                with zipfile.ZipFile(archive_path, "r") as zip_ref:
-                    zip_ref.extractall(extract_dir)
-
-            # 找到 frpc
-            for root, dirs, files in os.walk(extract_dir):
-                if frpc_name in files:
-                    src = Path(root) / frpc_name
-                    shutil.copy2(src, frpc_path)
-                    break
+        # 设置可执行权限 (Linux/Mac)
+        if platform.system() != "Windows":
+            os.chmod(frpc_path, 0o755)
 
-            if not frpc_path.exists():
-                raise RuntimeError("解压后未找到 frpc")
+        # 记录摘要，供下次启动校验缓存完整性
+        digest_path.write_text(self._sha256_of(frpc_path) + "\n")
 
-            # 设置可执行权限 (Linux/Mac)
-            if platform.system() != "Windows":
-                os.chmod(frpc_path, 0o755)
+        print(f"[FRP] frpc 准备完成: {frpc_path}")
 
-            print(f"[FRP] frpc 准备完成: {frpc_path}")
+        self.frpc_path = frpc_path
+        return frpc_path
 
+    @classmethod
+    def _extract_frpc_from_tar_stream(cls, url: str, frpc_name: str, frpc_path: Path):
+        """流式解压 tar.gz，直接从 HTTP 响应中提取 frpc
+
+        gzip 流无法从中断点续传，失败时整体重试。
+        """
+        last_error = None
+        for attempt in range(1, DOWNLOAD_RETRIES + 1):
+            try:
+                with urllib.request.urlopen(url) as resp:
+                    with tarfile.open(fileobj=resp, mode="r|gz") as tar:
+                        for member in tar:
+                            if member.isfile() and Path(member.name).name == frpc_name:
+                                with tar.extractfile(member) as src, open(frpc_path, "wb") as dst:
+                                    _copy_fast(src, dst)
+                                break
+                return
+            except (urllib.error.URLError, http.client.IncompleteRead, OSError) as e:
+                last_error = e
+                print(f"[FRP] 下载中断 ({attempt}/{DOWNLOAD_RETRIES}): {e}")
+        raise RuntimeError(f"下载失败: {last_error}")
+
+    @classmethod
+    def _extract_frpc_from_zip(cls, url: str, frpc_name: str, frpc_path: Path):
+        """解压 zip (Windows)，中央目录在文件尾部，先断点续传下载到本地"""
+        archive_path = frpc_path.parent / url.split("/")[-1]
+        try:
+            cls._download_archive(url, archive_path)
+            with zipfile.ZipFile(archive_path) as zip_ref:
+                for info in zip_ref.infolist():
+                    if Path(info.filename).name == frpc_name and not info.is_dir():
+                        with zip_ref.open(info) as src, open(frpc_path, "wb") as dst:
+                            _copy_fast(src, dst)
+                        break
         finally:
-            # 清理临时文件
             if archive_path.exists():
                 archive_path.unlink()
-            if extract_dir.exists():
-                shutil.rmtree(extract_dir)
 
-        self.frpc_path = frpc_path
-        return frpc_path
+    @classmethod
+    def _download_archive(cls, url: str, dest: Path):
+        """下载压缩包: 优先并行分段，失败退回断点续传"""
+        try:
+            head = urllib.request.Request(url, method="HEAD")
+            with urllib.request.urlopen(head) as resp:
+                size = int(resp.headers.get("Content-Length") or 0)
+                supports_range = resp.headers.get("Accept-Ranges") == "bytes"
+        except (urllib.error.URLError, OSError, ValueError):
+            size, supports_range = 0, False
+
+        if size >= PARALLEL_DOWNLOAD_THRESHOLD and supports_range:
+            try:
+                cls._download_parallel_ranges(url, dest, size)
+                return
+            except Exception as e:
+                print(f"[FRP] 并行下载失败，退回串行: {e}")
+                dest.unlink(missing_ok=True)
+
+        cls._download_with_resume(url, dest)
+
+    @staticmethod
+    def _download_parallel_ranges(url: str, dest: Path, size: int):
+        """并行 Range 下载: 预分配目标文件，各线程写各自的偏移段"""
+        with open(dest, "wb") as f:
+            f.truncate(size)
+
+        chunk = -(-size // PARALLEL_DOWNLOAD_WORKERS)
+        errors = []
+
+        def fetch(start: int, end: int):
+            try:
+                req = urllib.request.Request(
+                    url, headers={"Range": f"bytes={start}-{end}"})
+                with urllib.request.urlopen(req) as resp, open(dest, "r+b") as f:
+                    f.seek(start)
+                    shutil.copyfileobj(resp, f, length=256 * 1024)
+            except Exception as e:
+                errors.append(e)
+
+        threads = []
+        for start in range(0, size, chunk):
+            t = threading.Thread(
+                target=fetch, args=(start, min(start + chunk, size) - 1))
+            t.start()
+            threads.append(t)
+        for t in threads:
+            t.join()
+
+        if errors:
+            raise RuntimeError(f"分段下载失败: {errors[0]}")
+
+    @staticmethod
+    def _download_with_resume(url: str, dest: Path):
+        """断点续传下载: 用 Range 头从已有的部分文件继续"""
+        last_error = None
+        for attempt in range(1, DOWNLOAD_RETRIES + 1):
+            offset = dest.stat().st_size if dest.exists() else 0
+            headers = {"Range": f"bytes={offset}-"} if offset else {}
+            try:
+                req = urllib.request.Request(url, headers=headers)
+                with urllib.request.urlopen(req) as resp:
+                    # 服务端不支持 Range 时返回 200 并重发全量
+                    mode = "ab" if resp.status == 206 else "wb"
+                    with open(dest, mode) as f:
+                        shutil.copyfileobj(resp, f, length=256 * 1024)
+                return
+            except (urllib.error.URLError, http.client.IncompleteRead, OSError) as e:
+                last_error = e
+                print(f"[FRP] 下载中断 ({attempt}/{DOWNLOAD_RETRIES}): {e}")
+        raise RuntimeError(f"下载失败: {last_error}")
 
     def generate_config(self) -> Path:
         """生成 frpc.toml 配置文件 (v0.52.0+ 使用 TOML 格式)"""
@@ -159,15 +321,52 @@ remotePort = {self.remote_port}
         self.process = subprocess.Popen(
             cmd,
             stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            text=True
+            stderr=subprocess.PIPE
         )
 
+        # 持续排空管道，防止 64KB 管道缓冲写满后 frpc 阻塞
+        for stream, ring in ((self.process.stdout, self._stdout_ring),
+                             (self.process.stderr, self._stderr_ring)):
+            threading.Thread(
+                target=self._drain, args=(stream, ring), daemon=True).start()
+
         print(f"[FRP] frpc 已启动, PID: {self.process.pid}")
         print(f"[FRP] 远程访问地址: http://{self.server_addr}:{self.remote_port}")
 
         return self.process
 
+    @staticmethod
+    def _drain(stream, ring: deque):
+        """后台线程: 把 frpc 输出按行读入有界环形缓冲"""
+        for raw in iter(stream.readline, b""):
+            ring.append(raw.decode("utf-8", "replace").rstrip("\n"))
+        stream.close()
+
+    def get_recent_logs(self, limit: int = 50) -> dict:
+        """返回 frpc 最近的输出，用于排查问题"""
+        return {
+            "stdout": list(self._stdout_ring)[-limit:],
+            "stderr": list(self._stderr_ring)[-limit:],
+        }
+
+    def wait_ready(self, timeout: float = 5.0) -> bool:
+        """等待 frpc 建立隧道，以日志中的就绪信号为准
+
+        看到 "start proxy success" 立即返回 True；
+        进程退出或超时返回 False。
+        """
+        if not self.process:
+            return False
+
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                return False
+            if any("start proxy success" in line for line in list(self._stdout_ring)):
+                return True
+            time.sleep(0.05)
+        return False
+
     def stop(self):
         """停止 frpc"""
         if self.process:
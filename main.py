@@ -8,7 +8,7 @@ TerminalMCP - 终端 MCP Server + FRP 代理
 import argparse
 import signal
 import sys
-import time
+import threading
 import uuid
 
 from frp_manager import FRPManager
@@ -32,6 +32,8 @@ USAGE_GUIDE = """
   - run_terminal    : 执行终端命令
   - list_files      : 列出目录文件
   - read_file       : 读取文件内容
+  - download_file   : 下载文件 (base64)
+  - upload_file     : 上传文件 (base64)
 
 【配置 AI 助手】
   在 Claude Desktop 或其他 MCP 客户端配置:
@@ -163,6 +165,12 @@ def main():
     signal.signal(signal.SIGTERM, signal_handler)
 
     try:
+        # mcp_server 导入较重 (fastmcp/pydantic/starlette)，
+        # 放到后台线程与 FRP 准备并行
+        import_thread = threading.Thread(
+            target=__import__, args=("mcp_server",), daemon=True)
+        import_thread.start()
+
         # 1. 下载/准备 frpc
         print("\n[Main] 准备 FRP 客户端...")
         frp_manager.download_frpc()
@@ -175,16 +183,19 @@ def main():
         print("\n[Main] 启动 FRP 客户端...")
         frp_process = frp_manager.start()
 
-        # 等待 frpc 建立连接
-        time.sleep(2)
+        # 等待 frpc 建立连接 (读取就绪日志，取代固定 sleep)
+        if frp_manager.wait_ready(timeout=5):
+            print("[Main] FRP 隧道已建立")
 
         # 检查 frpc 是否正常运行
         if frp_process.poll() is not None:
             # frpc 已退出，打印错误
-            stdout, stderr = frp_process.communicate()
             print(f"[FRP] 启动失败!")
-            print(f"[FRP] stdout: {stdout}")
-            print(f"[FRP] stderr: {stderr}")
+            logs = frp_manager.get_recent_logs()
+            for line in logs["stdout"]:
+                print(f"[FRP] stdout: {line}")
+            for line in logs["stderr"]:
+                print(f"[FRP] stderr: {line}")
             sys.exit(1)
 
         # 4. 启动 MCP Server (阻塞)
@@ -194,7 +205,8 @@ def main():
         print("[Main] 按 Ctrl+C 停止服务")
         print("=" * 62)
 
-        # 导入并启动 MCP Server
+        # 导入并启动 MCP Server (后台线程已预热导入)
+        import_thread.join()
         from mcp_server import start_server
         start_server(host="0.0.0.0", port=args.local_port)
 
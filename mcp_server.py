@@ -1,90 +1,357 @@
+import asyncio
+import base64
+import functools
+import mmap
 import os
 import platform
 import shlex
+import signal
 import socket
-import subprocess
+import stat
+import threading
+from collections import OrderedDict, deque
+from dataclasses import dataclass
+from itertools import islice
 from typing import Dict, List, Optional, Union
 
 from fastmcp import FastMCP
 
+# 进程生命周期内不变，导入时缓存
+_IS_WINDOWS = platform.system() == "Windows"
+
+
+@dataclass(frozen=True, slots=True)
+class SysInfo:
+    """固定的主机环境信息"""
+    os: str
+    os_version: str
+    machine: str
+    hostname: str
+    user: str
+    shell: str
 
-def get_system_info() -> dict:
-    """获取系统信息"""
-    info = {
-        "os": platform.system(),
-        "os_version": platform.version(),
-        "machine": platform.machine(),
-        "hostname": socket.gethostname(),
-        "user": os.environ.get("USER") or os.environ.get("USERNAME", "unknown"),
-    }
 
-    # 获取 shell 信息
-    if platform.system() == "Windows":
-        info["shell"] = "cmd.exe / PowerShell"
+@functools.cache
+def get_system_info() -> SysInfo:
+    """获取系统信息 (进程内只计算一次)"""
+    if _IS_WINDOWS:
+        shell = "cmd.exe / PowerShell"
     else:
-        info["shell"] = os.environ.get("SHELL", "/bin/sh")
+        shell = os.environ.get("SHELL", "/bin/sh")
 
-    return info
+    return SysInfo(
+        os=platform.system(),
+        os_version=platform.version(),
+        machine=platform.machine(),
+        hostname=socket.gethostname(),
+        user=os.environ.get("USER") or os.environ.get("USERNAME", "unknown"),
+        shell=shell,
+    )
 
 
-# 获取系统信息
-SYSTEM_INFO = get_system_info()
+# MCP Server 实例，首次调用 get_server 时创建
+mcp: Optional[FastMCP] = None
 
-# 动态生成描述
-SERVER_DESCRIPTION = f"""TerminalMCP - Remote Terminal Access
-System: {SYSTEM_INFO['os']} ({SYSTEM_INFO['machine']})
-Host: {SYSTEM_INFO['hostname']}
-User: {SYSTEM_INFO['user']}
-Shell: {SYSTEM_INFO['shell']}"""
 
-# 创建 MCP Server 实例
-mcp = FastMCP("TerminalMCP", instructions=SERVER_DESCRIPTION)
+# 单次读取的块大小: 大块读取减少系统调用次数
+_CAPTURE_READ_SIZE = 1024 * 1024
+# 每条输出流保留的字节数上限
+_CAPTURE_MAX_BYTES = 1024 * 1024
 
 
-# 动态生成工具描述
-RUN_TERMINAL_DESC = f"""执行终端命令
+async def _drain_stream(stream: asyncio.StreamReader, ring: deque):
+    """有界读取子进程输出流
 
-【系统环境】
-- 操作系统: {SYSTEM_INFO['os']} {SYSTEM_INFO['os_version'][:30]}...
-- 主机名: {SYSTEM_INFO['hostname']}
-- 用户: {SYSTEM_INFO['user']}
-- Shell: {SYSTEM_INFO['shell']}
+    持续从管道读取避免子进程因管道写满而阻塞；环形缓冲只保留
+    最近 1MB 输出，命令输出再大内存也不会膨胀。
+    """
+    size = 0
+    while chunk := await stream.read(_CAPTURE_READ_SIZE):
+        ring.append(chunk)
+        size += len(chunk)
+        while size > _CAPTURE_MAX_BYTES:
+            size -= len(ring.popleft())
 
-【注意事项】
-- Windows 系统请使用: cmd /c <command> 或 powershell -Command "<command>"
-- Linux/Mac 直接执行命令即可
 
-Args:
-    command: 要执行的shell命令
-    timeout: 命令超时时间(秒)，默认30秒
+@functools.lru_cache(maxsize=512)
+def _split_command(command: str) -> tuple:
+    """缓存 shlex 分词结果，agent 循环中重复命令很常见"""
+    return tuple(shlex.split(command))
+
+
+async def run_terminal(command: str, timeout: int = 30, shell: bool = False,
+                       binary: bool = False) -> Dict[str, Union[str, int]]:
+    try:
+        # 子进程放进独立进程组，超时可整组回收 (POSIX)
+        kwargs = {
+            "stdout": asyncio.subprocess.PIPE,
+            "stderr": asyncio.subprocess.PIPE,
+        }
+        if not _IS_WINDOWS:
+            kwargs["start_new_session"] = True
+
+        if shell:
+            # 整串交给系统 shell 解析，管道/重定向等元字符才能生效
+            proc = await asyncio.create_subprocess_shell(command, **kwargs)
+        else:
+            proc = await asyncio.create_subprocess_exec(
+                *_split_command(command), **kwargs)
+
+        stdout_ring: deque = deque()
+        stderr_ring: deque = deque()
+        try:
+            await asyncio.wait_for(
+                asyncio.gather(
+                    _drain_stream(proc.stdout, stdout_ring),
+                    _drain_stream(proc.stderr, stderr_ring),
+                    proc.wait()
+                ),
+                timeout=timeout
+            )
+        except asyncio.TimeoutError:
+            # 3.11 起与内置 TimeoutError 同类，3.10 上只有这个能接住
+            # 杀掉整个进程组，shell 模式下连同其子进程一起回收
+            if not _IS_WINDOWS:
+                try:
+                    os.killpg(proc.pid, signal.SIGKILL)
+                except ProcessLookupError:
+                    pass
+            else:
+                proc.kill()
+            await proc.wait()
+            return {
+                "status": "error",
+                "error": f"Command timed out after {timeout} seconds"
+            }
+
+        stdout_raw = b"".join(stdout_ring)
+        stderr_raw = b"".join(stderr_ring)
+        if binary:
+            # 二进制输出不做 utf-8 解码，以 base64 原样返回
+            return {
+                "status": "success",
+                "exit_code": proc.returncode,
+                "stdout_base64": base64.b64encode(stdout_raw).decode("ascii"),
+                "stderr_base64": base64.b64encode(stderr_raw).decode("ascii")
+            }
+
+        return {
+            "status": "success",
+            "exit_code": proc.returncode,
+            "stdout": stdout_raw.decode("utf-8", "replace"),
+            "stderr": stderr_raw.decode("utf-8", "replace")
+        }
+    except Exception as e:
+        return {
+            "status": "error",
+            "error": str(e)
+        }
 
-Returns:
-    包含执行结果的字典
-"""
 
+# 目录列表缓存: 任何目录项增删都会改变目录 mtime，键随之失效
+_LS_CACHE: OrderedDict = OrderedDict()
+_LS_CACHE_MAX = 128
 
-@mcp.tool(description=RUN_TERMINAL_DESC)
-def run_terminal(command: str, timeout: int = 30) -> Dict[str, Union[str, int]]:
+
+async def list_files(path: str = ".",
+                     max_entries: Optional[int] = None) -> Dict[str, Union[str, List[dict]]]:
+    # 磁盘操作丢进工作线程，事件循环可以并行处理其他请求
+    return await asyncio.to_thread(_list_files_sync, path, max_entries)
+
+
+def _list_files_sync(path: str,
+                     max_entries: Optional[int] = None) -> Dict[str, Union[str, List[dict]]]:
     try:
-        args = shlex.split(command)
-        result = subprocess.run(
-            args,
-            capture_output=True,
-            text=True,
-            timeout=timeout
-        )
+        dir_st = os.stat(path)
+        key = (os.path.abspath(path), dir_st.st_mtime_ns)
+        cached = _LS_CACHE.get(key)
+        if cached is not None:
+            _LS_CACHE.move_to_end(key)
+            # 目录 mtime 不变只保证名字集合不变，改写文件内容
+            # 不会碰父目录 mtime，因此条目元数据每次重新 stat
+            entries = []
+            for name in (cached if max_entries is None else cached[:max_entries]):
+                st = os.lstat(os.path.join(path, name))
+                entries.append({
+                    "name": name,
+                    "is_dir": stat.S_ISDIR(st.st_mode),
+                    "size": st.st_size,
+                    "mtime": st.st_mtime,
+                    "mode": stat.filemode(st.st_mode),
+                })
+            return {
+                "status": "success",
+                "entries": entries
+            }
+
+        # os.scandir 直接拿到目录项和 stat 信息，无需 fork 出 ls/dir 再解析文本
+        entries = []
+        with os.scandir(path) as it:
+            for entry in islice(it, max_entries):
+                st = entry.stat(follow_symlinks=False)
+                entries.append({
+                    "name": entry.name,
+                    "is_dir": entry.is_dir(follow_symlinks=False),
+                    "size": st.st_size,
+                    "mtime": st.st_mtime,
+                    "mode": stat.filemode(st.st_mode),
+                })
+
+        # 只缓存完整扫描的名字列表，截断列表对其他调用不完整
+        if max_entries is None:
+            _LS_CACHE[key] = [e["name"] for e in entries]
+            if len(_LS_CACHE) > _LS_CACHE_MAX:
+                _LS_CACHE.popitem(last=False)
 
         return {
             "status": "success",
-            "exit_code": result.returncode,
-            "stdout": result.stdout,
-            "stderr": result.stderr
+            "entries": entries
         }
-    except subprocess.TimeoutExpired:
+    except Exception as e:
         return {
             "status": "error",
-            "error": f"Command timed out after {timeout} seconds"
+            "error": str(e)
+        }
+
+
+# 父目录 fd 缓存: 命中后 open 只解析最后一段路径，
+# 跳过整条目录链的逐级查找 (openat 语义，仅 POSIX)。
+# 读操作跑在多个工作线程上，缓存必须加锁；调用方拿到的是
+# 缓存 fd 的 dup 副本，淘汰时关掉缓存 fd 不影响使用中的副本
+_DIR_FD_CACHE: OrderedDict = OrderedDict()
+_DIR_FD_CACHE_MAX = 32
+_DIR_FD_LOCK = threading.Lock()
+_DIR_FD_SUPPORTED = os.open in os.supports_dir_fd
+
+
+def _open_for_read(file_path: str) -> int:
+    """打开文件用于读取，父目录 fd 命中时绕过目录遍历"""
+    if _DIR_FD_SUPPORTED:
+        dirname, basename = os.path.split(os.path.abspath(file_path))
+        if basename:
+            dup_fd = None
+            with _DIR_FD_LOCK:
+                dfd = _DIR_FD_CACHE.get(dirname)
+                if dfd is None:
+                    try:
+                        dfd = os.open(dirname, os.O_RDONLY | os.O_DIRECTORY)
+                    except OSError:
+                        dfd = None
+                    else:
+                        _DIR_FD_CACHE[dirname] = dfd
+                        if len(_DIR_FD_CACHE) > _DIR_FD_CACHE_MAX:
+                            _, old_fd = _DIR_FD_CACHE.popitem(last=False)
+                            os.close(old_fd)
+                else:
+                    _DIR_FD_CACHE.move_to_end(dirname)
+                if dfd is not None:
+                    dup_fd = os.dup(dfd)
+            if dup_fd is not None:
+                try:
+                    return os.open(basename, os.O_RDONLY, dir_fd=dup_fd)
+                except OSError:
+                    # 目录可能已被删除重建导致 fd 过期，
+                    # 丢弃缓存后走普通路径拿到准确的错误
+                    with _DIR_FD_LOCK:
+                        stale = _DIR_FD_CACHE.pop(dirname, None)
+                        if stale is not None:
+                            os.close(stale)
+                finally:
+                    os.close(dup_fd)
+    return os.open(file_path, os.O_RDONLY)
+
+
+def _read_contents(file_path: str, max_lines: Optional[int],
+                   max_bytes: Optional[int]) -> tuple:
+    """读取文件，返回 (content, truncated, size)"""
+    if max_lines:
+        # islice 把行循环完全压到 C 层，无需估算读取大小
+        with open(file_path, 'r', encoding='utf-8',
+                  opener=lambda p, f: _open_for_read(p)) as f:
+            return ''.join(islice(f, max_lines)), False, 0
+
+    # 整文件读取直接在裸 fd 上进行，跳过 TextIOWrapper 的
+    # 8KB 分块和增量解码；大文件改走 mmap，由页缓存按需供页
+    fd = _open_for_read(file_path)
+    try:
+        size = os.fstat(fd).st_size
+        if size == 0:
+            # procfs 等虚拟文件 stat 大小为 0 但仍有内容，
+            # 不能按 stat 大小定读取量，只能读到 EOF 为止
+            chunks = []
+            total = 0
+            while max_bytes is None or total < max_bytes:
+                want = _CAPTURE_READ_SIZE
+                if max_bytes is not None:
+                    want = min(want, max_bytes - total)
+                chunk = os.read(fd, want)
+                if not chunk:
+                    break
+                chunks.append(chunk)
+                total += len(chunk)
+            truncated = bool(
+                max_bytes is not None and total >= max_bytes and os.read(fd, 1))
+            raw = b"".join(chunks)
+            content = (raw.decode('utf-8', 'replace') if truncated
+                       else raw.decode('utf-8'))
+            return content, truncated, total
+
+        limit = size if max_bytes is None else min(size, max_bytes)
+        truncated = limit < size
+        if limit > _MMAP_THRESHOLD:
+            with mmap.mmap(fd, 0, access=mmap.ACCESS_READ) as mm:
+                raw = mm[:limit]
+        else:
+            chunks = []
+            remaining = limit
+            while remaining:
+                chunk = os.read(fd, remaining)
+                if not chunk:
+                    break
+                chunks.append(chunk)
+                remaining -= len(chunk)
+            raw = chunks[0] if len(chunks) == 1 else b"".join(chunks)
+    finally:
+        os.close(fd)
+
+    # 截断可能切在多字节字符中间，用 replace 容错
+    content = raw.decode('utf-8', 'replace') if truncated else raw.decode('utf-8')
+    return content, truncated, size
+
+
+@functools.lru_cache(maxsize=128)
+def _read_cached(file_path: str, ino: int, mtime_ns: int, size: int,
+                 max_lines: Optional[int], max_bytes: Optional[int]) -> tuple:
+    """带缓存的读取; inode/mtime_ns/size 只作缓存键，文件一变即失效"""
+    return _read_contents(file_path, max_lines, max_bytes)
+
+
+async def read_file(file_path: str, max_lines: Optional[int] = None,
+                    max_bytes: Optional[int] = 10_000_000) -> Dict[str, Union[str, bool, int]]:
+    # 磁盘操作丢进工作线程，多个并发读互不阻塞
+    return await asyncio.to_thread(_read_file_sync, file_path, max_lines, max_bytes)
+
+
+def _read_file_sync(file_path: str, max_lines: Optional[int],
+                    max_bytes: Optional[int]) -> Dict[str, Union[str, bool, int]]:
+    try:
+        st = os.stat(file_path)
+        if st.st_size > _MMAP_THRESHOLD:
+            # 大文件不进缓存，避免 LRU 占住上 GB 内存
+            content, truncated, size = _read_contents(file_path, max_lines, max_bytes)
+        else:
+            content, truncated, size = _read_cached(
+                file_path, st.st_ino, st.st_mtime_ns, st.st_size,
+                max_lines, max_bytes)
+
+        result = {
+            "status": "success",
+            "content": content
         }
+        if truncated:
+            result["truncated"] = True
+            result["size"] = size
+        return result
     except Exception as e:
         return {
             "status": "error",
@@ -92,44 +359,35 @@ def run_terminal(command: str, timeout: int = 30) -> Dict[str, Union[str, int]]:
         }
 
 
-LIST_FILES_DESC = f"""列出指定目录中的文件和目录
+# 超过此大小的文件用 mmap 读取
+_MMAP_THRESHOLD = 1024 * 1024
 
-【系统环境】{SYSTEM_INFO['os']} @ {SYSTEM_INFO['hostname']}
 
-Args:
-    path: 要列出内容的目录路径，默认为当前目录
+# base64 编码块大小，取 3 的倍数使中间块不产生填充
+_B64_ENCODE_CHUNK = 192 * 1024
 
-Returns:
-    包含文件和目录列表的字典
-"""
+
+async def download_file(file_path: str) -> Dict[str, Union[str, int]]:
+    return await asyncio.to_thread(_download_file_sync, file_path)
 
 
-@mcp.tool(description=LIST_FILES_DESC)
-def list_files(path: str = ".") -> Dict[str, Union[str, List[str]]]:
+def _download_file_sync(file_path: str) -> Dict[str, Union[str, int]]:
     try:
-        if platform.system() == "Windows":
-            result = subprocess.run(
-                ["cmd", "/c", "dir", path],
-                capture_output=True,
-                text=True
-            )
-        else:
-            result = subprocess.run(
-                ["ls", "-la", path],
-                capture_output=True,
-                text=True
-            )
+        size = os.path.getsize(file_path)
+        # 分块编码，峰值内存只多一个块，而不是整个文件的 ~2.3 倍；
+        # readinto 复用同一块读缓冲，不为每个分块新分配 bytes
+        buf = bytearray()
+        read_buf = bytearray(_B64_ENCODE_CHUNK)
+        view = memoryview(read_buf)
+        with open(file_path, "rb") as f:
+            while n := f.readinto(read_buf):
+                buf += base64.b64encode(view[:n])
 
-        if result.returncode == 0:
-            return {
-                "status": "success",
-                "output": result.stdout.splitlines()
-            }
-        else:
-            return {
-                "status": "error",
-                "error": result.stderr
-            }
+        return {
+            "status": "success",
+            "size": size,
+            "content_base64": buf.decode("ascii")
+        }
     except Exception as e:
         return {
             "status": "error",
@@ -137,49 +395,168 @@ def list_files(path: str = ".") -> Dict[str, Union[str, List[str]]]:
         }
 
 
-READ_FILE_DESC = f"""读取文件内容
+# base64 解码块大小，取 4 的倍数避免切断编码组
+_B64_DECODE_CHUNK = 256 * 1024
 
-【系统环境】{SYSTEM_INFO['os']} @ {SYSTEM_INFO['hostname']}
+
+async def upload_file(file_path: str, content_base64: str) -> Dict[str, Union[str, int]]:
+    return await asyncio.to_thread(_upload_file_sync, file_path, content_base64)
+
+
+def _upload_file_sync(file_path: str, content_base64: str) -> Dict[str, Union[str, int]]:
+    try:
+        # RFC 2045 风格的换行包装会破坏按固定宽度切块，先去掉所有空白
+        content_base64 = "".join(content_base64.split())
+
+        # 分块解码直接写盘，不在内存中展开整个解码结果；
+        # 先写临时文件再原子改名，解码失败不会留下截断的目标文件
+        tmp_path = f"{file_path}.uploading"
+        written = 0
+        try:
+            with open(tmp_path, "wb") as f:
+                for i in range(0, len(content_base64), _B64_DECODE_CHUNK):
+                    written += f.write(base64.b64decode(content_base64[i:i + _B64_DECODE_CHUNK]))
+            os.replace(tmp_path, file_path)
+        except Exception:
+            try:
+                os.unlink(tmp_path)
+            except OSError:
+                pass
+            raise
+
+        return {
+            "status": "success",
+            "size": written
+        }
+    except Exception as e:
+        return {
+            "status": "error",
+            "error": str(e)
+        }
+
+
+def _build_descriptions() -> Dict[str, str]:
+    """构建工具描述，嵌入当前系统信息"""
+    info = get_system_info()
+
+    # 各工具描述共用的环境标头，只构建一次
+    common_header = f"【系统环境】{info.os} @ {info.hostname}"
+
+    run_terminal_desc = f"""执行终端命令
+
+【系统环境】
+- 操作系统: {info.os} {info.os_version[:30]}...
+- 主机名: {info.hostname}
+- 用户: {info.user}
+- Shell: {info.shell}
+
+【注意事项】
+- Windows 系统请使用: cmd /c <command> 或 powershell -Command "<command>"
+- Linux/Mac 直接执行命令即可
+
+Args:
+    command: 要执行的shell命令
+    timeout: 命令超时时间(秒)，默认30秒
+    shell: 为 True 时交给系统 shell 解析，支持管道/重定向等
+           元字符；命令会原样执行，注意注入风险
+    binary: 为 True 时输出不做 utf-8 解码，以 base64 返回
+            (stdout_base64/stderr_base64)，适合二进制输出
+
+Returns:
+    包含执行结果的字典
+"""
+
+    list_files_desc = f"""列出指定目录中的文件和目录
+
+{common_header}
+
+Args:
+    path: 要列出内容的目录路径，默认为当前目录
+    max_entries: 最多返回的目录项数，默认不限制
+
+Returns:
+    包含目录项列表的字典，每项含 name/is_dir/size/mtime/mode
+"""
+
+    read_file_desc = f"""读取文件内容
+
+{common_header}
 
 Args:
     file_path: 要读取的文件路径
     max_lines: 最大读取行数，默认读取全部
+    max_bytes: 最大读取字节数，默认 10MB；超出部分截断，
+               大文件请改用 download_file
 
 Returns:
     包含文件内容的字典
 """
 
+    download_file_desc = f"""下载文件 (base64 编码返回)
 
-@mcp.tool(description=READ_FILE_DESC)
-def read_file(file_path: str, max_lines: Optional[int] = None) -> Dict[str, str]:
-    try:
-        with open(file_path, 'r', encoding='utf-8') as f:
-            if max_lines:
-                lines = []
-                for i, line in enumerate(f):
-                    if i >= max_lines:
-                        break
-                    lines.append(line)
-                content = ''.join(lines)
-            else:
-                content = f.read()
+{common_header}
 
-            return {
-                "status": "success",
-                "content": content
-            }
-    except Exception as e:
-        return {
-            "status": "error",
-            "error": str(e)
-        }
+Args:
+    file_path: 要下载的文件路径
+
+Returns:
+    包含 base64 编码内容和文件大小的字典
+"""
+
+    upload_file_desc = f"""上传文件 (接收 base64 编码内容并写入)
+
+{common_header}
+
+Args:
+    file_path: 要写入的文件路径
+    content_base64: base64 编码的文件内容
+
+Returns:
+    包含写入字节数的字典
+"""
+
+    return {
+        "run_terminal": run_terminal_desc,
+        "list_files": list_files_desc,
+        "read_file": read_file_desc,
+        "download_file": download_file_desc,
+        "upload_file": upload_file_desc,
+    }
+
+
+def get_server() -> FastMCP:
+    """创建并配置 MCP Server，重复调用返回同一实例
+
+    系统信息探测和描述字符串的构建都推迟到首次调用，
+    模块导入时不再产生额外开销。
+    """
+    global mcp
+    if mcp is not None:
+        return mcp
+
+    info = get_system_info()
+    instructions = f"""TerminalMCP - Remote Terminal Access
+System: {info.os} ({info.machine})
+Host: {info.hostname}
+User: {info.user}
+Shell: {info.shell}"""
+
+    mcp = FastMCP("TerminalMCP", instructions=instructions)
+
+    descriptions = _build_descriptions()
+    mcp.tool(description=descriptions["run_terminal"])(run_terminal)
+    mcp.tool(description=descriptions["list_files"])(list_files)
+    mcp.tool(description=descriptions["read_file"])(read_file)
+    mcp.tool(description=descriptions["download_file"])(download_file)
+    mcp.tool(description=descriptions["upload_file"])(upload_file)
+
+    return mcp
 
 
 def start_server(host: str = "0.0.0.0", port: int = 8001):
     """启动 MCP Server"""
-    mcp.run(transport="streamable-http", host=host, port=port)
+    get_server().run(transport="streamable-http", host=host, port=port)
 
 
 if __name__ == "__main__":
     start_server()
-